@@ -0,0 +1,81 @@
+"""
+Send throughput through the Bot API connection pool at different pool sizes.
+
+Concurrent send_message calls go to a local fake Bot API with a fixed response delay. The outbound
+scheduler is given a rate far above the load, so only the transport limits throughput.
+
+    python -m benchmarks.bot_api_pool --sends 2000 --concurrency 64 --latency-ms 30 --pool 1 --pool 8 --pool 32 --pool 100
+"""
+import time
+import asyncio
+import argparse
+import statistics
+
+from aiogram.bot.api import TelegramAPIServer
+
+from benchmarks.fake_bot_api import FakeBotApi
+from common.http_pool import PoolSettings
+from common.outbound import OutboundScheduler, ScheduledBot
+
+
+CHAT_ID_BASE = 3_000_000_000
+
+
+async def run(url: str, pool_size: int, args) -> dict:
+    bot = ScheduledBot(
+        token="1:bench",
+        server=TelegramAPIServer.from_base(url),
+        scheduler=OutboundScheduler(rate=1e9, bulk_share=1, chat_rate=1e9, chat_burst=1e9),
+        pool=PoolSettings(limit=pool_size, limit_per_host=0, keepalive_timeout=60, dns_ttl=300),
+    )
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: list[float] = []
+
+    async def send(i: int):
+        async with semaphore:
+            started = time.perf_counter()
+            await bot.send_message(CHAT_ID_BASE + i, "bench")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(i) for i in range(args.sends)))
+    elapsed = time.perf_counter() - started
+    stats = bot.pool_stats()
+    await bot.session.close()
+
+    latencies.sort()
+    return {
+        "sends_per_s": args.sends / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        **stats,
+    }
+
+
+async def main_async(args):
+    for pool_size in args.pool:
+        # A fresh server per pool size, so the connection count is per run
+        api = FakeBotApi(args.latency_ms / 1000)
+        url = await api.start()
+        result = await run(url, pool_size, args)
+        await api.stop()
+        print(
+            f"pool={pool_size:<4} {result['sends_per_s']:8.1f} sends/s  p50={result['p50_ms']:7.1f} ms  "
+            f"p95={result['p95_ms']:7.1f} ms  connections={len(api.connections):<4} "
+            f"pool waits={result['waits']} ({result['wait_ms']:.0f} ms total)"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pool", type=int, action="append", help="connection limit, repeatable")
+    parser.add_argument("--sends", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--latency-ms", type=float, default=30)
+    args = parser.parse_args()
+    args.pool = args.pool or [1, 8, 32, 100]
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
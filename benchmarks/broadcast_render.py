@@ -0,0 +1,68 @@
+"""
+Rendering throughput of personalized broadcast templates.
+
+Compares the compiled BroadcastTemplate with a naive per-message str.format over all placeholders.
+
+    python -m benchmarks.broadcast_render [--recipients 100000]
+"""
+import html
+import time
+import random
+import argparse
+
+from core.broadcast import BroadcastTemplate, PLACEHOLDERS
+from services.db.dto import BroadcastRecipient
+
+
+TEMPLATE = "\n".join((
+    "<b>{first_name}</b>, привет!",
+    "Твой статус: {status}.",
+    "Не забудь взять паспорт, если ты не из {university}.",
+))
+
+
+def recipients(count: int) -> list[BroadcastRecipient]:
+    rng = random.Random(1)
+    statuses = ("registered", "awaiting", "confirmed", "waitlisted", None)
+    return [
+        BroadcastRecipient(
+            chat_id=1_000_000 + i,
+            full_name=f"Иванов{i} Иван Иванович",
+            university=rng.choice(("МГТУ им. Н. Э. Баумана", "МФТИ", None)),
+            study_group=rng.choice(("ИУ7-13Б", None)),
+            status=rng.choice(statuses),
+        )
+        for i in range(count)
+    ]
+
+
+def bench_naive(rows: list[BroadcastRecipient]) -> float:
+    started = time.perf_counter()
+    for r in rows:
+        values = {name: html.escape(getter(r), quote=False) for name, getter in PLACEHOLDERS.items()}
+        TEMPLATE.format(**values)
+    return time.perf_counter() - started
+
+
+def bench_compiled(rows: list[BroadcastRecipient]) -> float:
+    started = time.perf_counter()
+    template = BroadcastTemplate(TEMPLATE)
+    render = template.render
+    for r in rows:
+        render(r)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipients", type=int, default=100_000)
+    args = parser.parse_args()
+    rows = recipients(args.recipients)
+
+    for name, bench in (("naive str.format", bench_naive), ("compiled template", bench_compiled)):
+        elapsed = bench(rows)
+        print(f"{name:<20} {args.recipients / elapsed:12.0f} messages/s")
+
+
+if __name__ == "__main__":
+    main()
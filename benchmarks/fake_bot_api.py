@@ -0,0 +1,64 @@
+"""
+A local stand-in for the Telegram Bot API: answers every method with a successful result after a fixed delay,
+which plays the part of the network round trip. Point a bot at it with
+`server=TelegramAPIServer.from_base(url)`.
+
+    python -m benchmarks.fake_bot_api --port 8081 --latency-ms 30
+"""
+import time
+import asyncio
+import argparse
+
+from aiohttp import web
+
+
+class FakeBotApi:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+        self.connections: set = set()
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner: web.AppRunner | None = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.calls += 1
+        # Distinct client connections seen, to tell pooled reuse from churn
+        self.connections.add(request.transport)
+        await request.read()
+        await asyncio.sleep(self.latency)
+        if request.match_info["method"].lower() == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        else:
+            result = {"message_id": self.calls, "date": int(time.time()), "chat": {"id": 1, "type": "private"}}
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        host, port = site._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+async def serve(args):
+    api = FakeBotApi(args.latency_ms / 1000)
+    print(f"Fake Bot API on {await api.start(args.host, args.port)}")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=30)
+    asyncio.run(serve(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
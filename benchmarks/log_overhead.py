@@ -0,0 +1,91 @@
+"""
+Hot-path cost of emitting the per-update access log record.
+
+Compares the old setup (synchronous StreamHandler, eager f-string) with the queue-based
+pipeline from common.log, with and without sampling. Only the time spent on the calling
+(event loop) thread is measured; the background writer drains the queue afterwards.
+`--sink-delay-us` emulates a back-pressured stdout (e.g. a slow docker log driver).
+With a fast sink (the default, no delay) the queue is not cheaper for the calling thread: the
+listener competes with it for the GIL. The gain appears as the sink slows down.
+
+    python -m benchmarks.log_overhead [--records 100000] [--sink-delay-us 50]
+"""
+import io
+import time
+import queue
+import logging
+import argparse
+import logging.handlers
+
+from common.log import TEXT_FORMAT, JsonFormatter, NonBlockingQueueHandler, SamplingFilter
+
+
+class SlowSink(io.StringIO):
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+
+    def write(self, s: str) -> int:
+        if self.delay:
+            time.sleep(self.delay)
+        return super().write(s)
+
+
+def _emit(logger: logging.Logger, records: int, eager: bool) -> float:
+    started = time.perf_counter()
+    for i in range(records):
+        if eager:
+            logger.info(f"Handled message for chat id {i} by handle_rsvp in {0.42} ms")
+        else:
+            logger.info("Handled message", extra={"chat_id": i, "handler": "handle_rsvp", "latency_ms": 0.42})
+    return time.perf_counter() - started
+
+
+def _logger(handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger("bot.access")
+    logger.handlers.clear()
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    return logger
+
+
+def bench_sync(records: int, delay: float) -> float:
+    handler = logging.StreamHandler(SlowSink(delay))
+    handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    return _emit(_logger(handler), records, eager=True)
+
+
+def bench_queue(records: int, delay: float, sampling: dict[str, float]) -> float:
+    output = logging.StreamHandler(SlowSink(delay))
+    output.setFormatter(JsonFormatter())
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    handler = NonBlockingQueueHandler(log_queue)
+    if sampling:
+        handler.addFilter(SamplingFilter(sampling))
+    listener = logging.handlers.QueueListener(log_queue, output)
+    listener.start()
+    try:
+        return _emit(_logger(handler), records, eager=False)
+    finally:
+        listener.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=100_000)
+    parser.add_argument("--sink-delay-us", type=float, default=0)
+    args = parser.parse_args()
+    delay = args.sink_delay_us / 1e6
+
+    results = {
+        "sync stream, f-string": bench_sync(args.records, delay),
+        "queue, json": bench_queue(args.records, delay, {}),
+        "queue, json, 10% sampled": bench_queue(args.records, delay, {"bot.access": 0.1}),
+    }
+    for name, elapsed in results.items():
+        print(f"{name:<28} {elapsed / args.records * 1e6:8.2f} us/record on the calling thread")
+
+
+if __name__ == "__main__":
+    main()
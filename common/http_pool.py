@@ -0,0 +1,76 @@
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+import aiohttp
+
+
+@dataclass
+class PoolSettings:
+    # Connection limits of the Bot API pool; 0 means unlimited, as in aiohttp
+    limit: int
+    limit_per_host: int
+    keepalive_timeout: float
+    dns_ttl: int
+
+    def connector_kwargs(self) -> dict:
+        return dict(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_ttl,
+        )
+
+
+class PoolMetrics:
+    """
+    Connection pool counters collected through aiohttp request tracing.
+    The current number of active and idle connections is read from the connector itself.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.created = 0
+        self.reused = 0
+        self.waits = 0
+        self.waiting = 0
+        self.wait_seconds = 0.0
+
+        self.trace_config = aiohttp.TraceConfig()
+        self.trace_config.on_request_start.append(self._on_request_start)
+        self.trace_config.on_connection_create_end.append(self._on_connection_create_end)
+        self.trace_config.on_connection_reuseconn.append(self._on_connection_reuseconn)
+        self.trace_config.on_connection_queued_start.append(self._on_queued_start)
+        self.trace_config.on_connection_queued_end.append(self._on_queued_end)
+
+    async def _on_request_start(self, session, ctx: SimpleNamespace, params) -> None:
+        self.requests += 1
+
+    async def _on_connection_create_end(self, session, ctx: SimpleNamespace, params) -> None:
+        self.created += 1
+
+    async def _on_connection_reuseconn(self, session, ctx: SimpleNamespace, params) -> None:
+        self.reused += 1
+
+    async def _on_queued_start(self, session, ctx: SimpleNamespace, params) -> None:
+        # A request waits here when the pool (or its per-host share) is exhausted
+        self.waits += 1
+        self.waiting += 1
+        ctx.queued_at = time.monotonic()
+
+    async def _on_queued_end(self, session, ctx: SimpleNamespace, params) -> None:
+        self.waiting -= 1
+        self.wait_seconds += time.monotonic() - ctx.queued_at
+
+    def snapshot(self, session: aiohttp.ClientSession | None) -> dict:
+        connector = session.connector if session is not None and not session.closed else None
+        return {
+            "active": len(getattr(connector, "_acquired", ())),
+            "idle": sum(len(conns) for conns in getattr(connector, "_conns", {}).values()),
+            "waiting": self.waiting,
+            "requests": self.requests,
+            "created": self.created,
+            "reused": self.reused,
+            "waits": self.waits,
+            "wait_ms": round(self.wait_seconds * 1000, 1),
+        }
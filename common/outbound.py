@@ -0,0 +1,206 @@
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+
+import aiohttp
+from aiogram import Bot
+from aiogram.utils import json
+from aiogram.utils.exceptions import RetryAfter
+
+from common.http_pool import PoolMetrics, PoolSettings
+from common.token_bucket import BucketTable, TokenBucket
+
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    RSVP = 1
+    BROADCAST = 2
+
+
+_current_priority: ContextVar[Priority] = ContextVar("outbound_priority", default=Priority.INTERACTIVE)
+
+
+@contextmanager
+def priority(value: Priority):
+    """Marks every Bot API send made from the enclosed code (in the current task) with the given priority."""
+    token = _current_priority.set(value)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class OutboundScheduler:
+    """
+    Hands out send slots under one shared rate budget. Waiting sends are served by priority, then FIFO;
+    bulk classes (anything below INTERACTIVE) only get `bulk_share` of the budget, so interactive replies
+    always find spare capacity. Each chat is additionally paced by its own token bucket.
+    """
+
+    def __init__(self, rate: float, bulk_share: float, chat_rate: float, chat_burst: float, sweep_interval: float = 60.0):
+        self.rate = rate
+        self.bulk_rate = rate * bulk_share
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.sweep_interval = sweep_interval
+        self.sent: dict[Priority, int] = {p: 0 for p in Priority}
+        self.waited: dict[Priority, int] = {p: 0 for p in Priority}
+
+        now = time.monotonic()
+        self._global = TokenBucket(rate, now)
+        self._bulk = TokenBucket(self.bulk_rate, now)
+        self._chats: BucketTable[int, TokenBucket] = BucketTable(chat_rate, chat_burst)
+        self._paused_until = 0.0
+        self._next_sweep = now + sweep_interval
+
+        self._queue: list[tuple[int, int, int | None, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._wakeup: asyncio.Event | None = None
+        self._pump_task: asyncio.Task | None = None
+
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, chat_id: int | None, prio: Priority) -> None:
+        now = time.monotonic()
+        self._refill(now)
+        if not self._queue and self._wait_time(chat_id, prio, now) == 0:
+            self._take(chat_id, prio)
+            return
+
+        self.waited[prio] += 1
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (int(prio), next(self._seq), chat_id, future))
+        self._ensure_pump()
+        self._wakeup.set()
+        await future
+
+    def _refill(self, now: float) -> None:
+        self._global.refill(now, self.rate, self.rate)
+        self._bulk.refill(now, self.bulk_rate, self.bulk_rate)
+        if now >= self._next_sweep:
+            self._chats.sweep(now)
+            self._next_sweep = now + self.sweep_interval
+
+    def _wait_time(self, chat_id: int | None, prio: Priority, now: float) -> float:
+        wait = max(self._paused_until - now, self._global.wait_time(self.rate))
+        if prio != Priority.INTERACTIVE:
+            wait = max(wait, self._bulk.wait_time(self.bulk_rate))
+        if chat_id is not None:
+            wait = max(wait, self._chats.get(chat_id, now).wait_time(self.chat_rate))
+        return wait
+
+    def _take(self, chat_id: int | None, prio: Priority) -> None:
+        self._global.tokens -= 1
+        if prio != Priority.INTERACTIVE:
+            self._bulk.tokens -= 1
+        if chat_id is not None:
+            self._chats[chat_id].tokens -= 1
+        self.sent[prio] += 1
+
+    def _ensure_pump(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+
+    async def _pump(self) -> None:
+        while self._queue:
+            self._wakeup.clear()
+            now = time.monotonic()
+            self._refill(now)
+
+            # Serve the first waiting send (by priority, then arrival) that may go right now;
+            # the ones skipped over are only held back by their chat's pacing or the bulk share
+            skipped = []
+            next_wait = None
+            while self._queue:
+                entry = heapq.heappop(self._queue)
+                prio, _, chat_id, future = entry
+                if future.done():
+                    continue
+                wait = self._wait_time(chat_id, Priority(prio), now)
+                if wait == 0:
+                    self._take(chat_id, Priority(prio))
+                    future.set_result(None)
+                    break
+                skipped.append(entry)
+                next_wait = wait if next_wait is None else min(next_wait, wait)
+            else:
+                for entry in skipped:
+                    heapq.heappush(self._queue, entry)
+                if next_wait is not None:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=next_wait)
+                    except asyncio.TimeoutError:
+                        pass
+                continue
+            for entry in skipped:
+                heapq.heappush(self._queue, entry)
+            # Let the granted send run before serving the next one
+            await asyncio.sleep(0)
+
+
+# Methods that deliver something to a chat and count towards the flood limits
+SCHEDULED_METHOD_PREFIXES = ("send", "copy", "forward", "edit")
+
+
+class ScheduledBot(Bot):
+    def __init__(
+        self,
+        *args,
+        scheduler: OutboundScheduler,
+        pool: PoolSettings | None = None,
+        upload_timeout: aiohttp.ClientTimeout | None = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler
+        self.upload_timeout = upload_timeout
+        self.pool_metrics = PoolMetrics()
+        if pool is not None:
+            self._connector_init.update(pool.connector_kwargs())
+
+    def get_new_session(self) -> aiohttp.ClientSession:
+        # Same as Bot.get_new_session, plus tracing for the pool metrics
+        return aiohttp.ClientSession(
+            connector=self._connector_class(**self._connector_init, loop=self._main_loop),
+            loop=self._main_loop,
+            json_serialize=json.dumps,
+            trace_configs=[self.pool_metrics.trace_config],
+        )
+
+    def pool_stats(self) -> dict:
+        return self.pool_metrics.snapshot(self._session)
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        if files and self.upload_timeout is not None and self._ctx_timeout.get(None) is None:
+            # A file upload (video, export) outlasts the timeout sized for plain calls; an explicit
+            # request_timeout() around the call still wins
+            with self.request_timeout(self.upload_timeout):
+                return await self.request(method, data, files, **kwargs)
+        if not method.startswith(SCHEDULED_METHOD_PREFIXES):
+            return await super().request(method, data, files, **kwargs)
+
+        chat_id = data.get("chat_id") if data else None
+        prio = _current_priority.get()
+        try:
+            await self.scheduler.acquire(chat_id, prio)
+            return await super().request(method, data, files, **kwargs)
+        except RetryAfter as e:
+            # Telegram's flood control applies to the whole token: stop everyone, then retry once
+            logger.warning("Flood control hit, pausing sends", extra={"chat_id": chat_id, "retry_after": e.timeout})
+            self.scheduler.pause(e.timeout)
+            await self.scheduler.acquire(chat_id, prio)
+            return await super().request(method, data, files, **kwargs)
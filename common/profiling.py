@@ -0,0 +1,224 @@
+import io
+import sys
+import math
+import time
+import signal
+import asyncio
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+
+# Frames of the selector poll: the event loop is idle while it is on top of the stack
+IDLE_FUNCTIONS = {("selectors.py", "select"), ("selectors.py", "poll")}
+
+
+class ProfilerBusyException(Exception):
+    def __init__(self):
+        super().__init__("A profiling session is already running")
+
+
+class ProfilerUnavailableException(Exception):
+    def __init__(self):
+        super().__init__("CPU sampling needs SIGPROF and an event loop on the main thread")
+
+
+def _frame_key(code) -> tuple[str, int, str]:
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+def _short_path(path: str) -> str:
+    for prefix in sorted(sys.path, key=len, reverse=True):
+        if prefix and path.startswith(prefix):
+            return path[len(prefix):].lstrip("/\\")
+    return path
+
+
+class _Sampler:
+    """
+    Samples the event loop thread from a SIGPROF handler. The timer counts process CPU time and Python runs
+    the handler on the main thread at the interrupted frame, so a busy loop is sampled where it actually
+    runs. A thread polling sys._current_frames() would only see the loop when it releases the GIL, which it
+    mostly does inside select. Samples that land in select are CPU burned by other threads.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples = 0
+        self.idle = 0
+        self.own: Counter = Counter()
+        self.total: Counter = Counter()
+        self._previous_handler = None
+
+    def _handle(self, signum, frame) -> None:
+        if frame is None:
+            return
+        self.samples += 1
+        code = frame.f_code
+        if (code.co_filename.rsplit("/", 1)[-1], code.co_name) in IDLE_FUNCTIONS:
+            self.idle += 1
+            return
+        self.own[_frame_key(code)] += 1
+        seen = set()
+        while frame is not None:
+            key = _frame_key(frame.f_code)
+            if key not in seen:
+                seen.add(key)
+                self.total[key] += 1
+            frame = frame.f_back
+
+    def start(self) -> None:
+        self._previous_handler = signal.signal(signal.SIGPROF, self._handle)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self) -> None:
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self._previous_handler)
+
+
+class _SelectTimer:
+    """Busy time of the event loop: wall time minus the time its selector spent waiting for events."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._selector = getattr(loop, "_selector", None)
+        self.waited = 0.0
+        self.elapsed = 0.0
+        self._started = 0.0
+
+    @property
+    def available(self) -> bool:
+        return self._selector is not None
+
+    def start(self) -> None:
+        self._started = time.perf_counter()
+        if self._selector is None:
+            return
+        select = self._selector.select
+
+        def timed_select(timeout=None):
+            started = time.perf_counter()
+            try:
+                return select(timeout)
+            finally:
+                self.waited += time.perf_counter() - started
+
+        self._selector.select = timed_select
+
+    def stop(self) -> None:
+        self.elapsed = time.perf_counter() - self._started
+        if self._selector is not None:
+            del self._selector.select
+
+
+async def _measure_loop_lag(interval: float, lags: list[float]) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - started - interval))
+
+
+class Profiler:
+    """
+    Profiles the running process for a limited time: event loop busy time, a sampling CPU profiler over
+    the event loop thread, tracemalloc allocation tracking and event loop lag. Nothing is hooked in between
+    sessions. The loop must run on the main thread, where Python delivers signals.
+    """
+
+    def __init__(self, sample_interval: float = 0.005, lag_interval: float = 0.05, top: int = 25):
+        self.sample_interval = sample_interval
+        self.lag_interval = lag_interval
+        self.top = top
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def run(self, seconds: float, memory: bool = True) -> str:
+        if not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+            raise ProfilerUnavailableException()
+        if self._lock.locked():
+            raise ProfilerBusyException()
+        async with self._lock:
+            return await self._run(seconds, memory)
+
+    async def _run(self, seconds: float, memory: bool) -> str:
+        started_at = datetime.now()
+        was_tracing = tracemalloc.is_tracing()
+        if memory and not was_tracing:
+            tracemalloc.start()
+        before = tracemalloc.take_snapshot() if memory else None
+
+        lags: list[float] = []
+        lag_task = asyncio.create_task(_measure_loop_lag(self.lag_interval, lags))
+        sampler = _Sampler(self.sample_interval)
+        select_timer = _SelectTimer(asyncio.get_running_loop())
+        select_timer.start()
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            sampler.stop()
+            select_timer.stop()
+            lag_task.cancel()
+            after = tracemalloc.take_snapshot() if memory else None
+            peak = tracemalloc.get_traced_memory()[1]
+            if memory and not was_tracing:
+                tracemalloc.stop()
+
+        return self._report(started_at, seconds, sampler, select_timer, lags, before, after, peak)
+
+    def _report(self, started_at, seconds, sampler: _Sampler, select_timer: _SelectTimer, lags, before, after, peak) -> str:
+        out = io.StringIO()
+        out.write(f"Profile started {started_at.isoformat(timespec='seconds')}, {seconds:g} s\n")
+        if before is not None:
+            # Every allocation goes through tracemalloc's hook, which slows allocation-heavy code severalfold
+            out.write("tracemalloc was on: CPU shares and loop lag are inflated for allocation-heavy code\n")
+        out.write("\n")
+
+        out.write("== Event loop busy (wall time outside the selector wait) ==\n")
+        if select_timer.available and select_timer.elapsed:
+            busy_time = max(0.0, select_timer.elapsed - select_timer.waited)
+            out.write(f"busy: {busy_time:.2f} s of {select_timer.elapsed:.2f} s ({busy_time / select_timer.elapsed:.1%})\n")
+        else:
+            out.write("not measured: the loop has no selector\n")
+
+        busy = sampler.samples - sampler.idle
+        out.write(f"\n== CPU (event loop thread, sample every {self.sample_interval * 1000:g} ms of process CPU time) ==\n")
+        out.write(f"samples: {sampler.samples}, on the event loop: {busy}, other threads (loop waiting): {sampler.idle}\n")
+        for title, counter in (("own time", sampler.own), ("cumulative", sampler.total)):
+            out.write(f"\n-- top functions by {title} --\n")
+            for (path, line, name), count in counter.most_common(self.top):
+                share = count / busy if busy else 0
+                out.write(f"{count:8d} {share:7.1%}  {name}  {_short_path(path)}:{line}\n")
+
+        if before is not None:
+            out.write("\n== Allocations (tracemalloc, growth over the session) ==\n")
+            out.write(f"peak traced: {peak / 1024:.1f} KiB\n")
+            filters = (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<unknown>"),
+                tracemalloc.Filter(False, __file__),
+            )
+            diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+            for stat in diff[:self.top]:
+                frame = stat.traceback[0]
+                out.write(
+                    f"{stat.size_diff / 1024:+10.1f} KiB {stat.count_diff:+8d} blocks  "
+                    f"{_short_path(frame.filename)}:{frame.lineno}\n"
+                )
+
+        out.write(f"\n== Event loop lag (probe every {self.lag_interval * 1000:g} ms) ==\n")
+        if lags:
+            ordered = sorted(lags)
+            out.write(
+                f"probes: {len(ordered)}, mean: {sum(ordered) / len(ordered) * 1000:.2f} ms, "
+                f"p95: {ordered[math.ceil(len(ordered) * 0.95) - 1] * 1000:.2f} ms, "
+                f"max: {ordered[-1] * 1000:.2f} ms\n"
+            )
+        else:
+            out.write("no probes\n")
+        return out.getvalue()
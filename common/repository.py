@@ -1,8 +1,28 @@
-from aiogram import Bot, Dispatcher
+import aiohttp
+from aiogram import Dispatcher
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 
+from common.http_pool import PoolSettings
+from common.outbound import OutboundScheduler, ScheduledBot
 from config import config
 
 
-bot = Bot(token=config.telegram_bot_token)
+bot = ScheduledBot(
+    token=config.telegram_bot_token,
+    scheduler=OutboundScheduler(
+        rate=config.outbound_rate,
+        bulk_share=config.outbound_bulk_share,
+        chat_rate=config.outbound_chat_rate,
+        chat_burst=config.outbound_chat_burst,
+    ),
+    pool=PoolSettings(
+        limit=config.bot_api_connections,
+        limit_per_host=config.bot_api_connections_per_host,
+        keepalive_timeout=config.bot_api_keepalive,
+        dns_ttl=config.bot_api_dns_ttl,
+    ),
+    # Only the total timeout carries over to long polling, which extends it by the polling timeout
+    timeout=aiohttp.ClientTimeout(total=config.bot_api_timeout, connect=config.bot_api_connect_timeout),
+    upload_timeout=aiohttp.ClientTimeout(total=config.bot_api_upload_timeout, connect=config.bot_api_connect_timeout),
+)
 dp = Dispatcher(bot, storage=MemoryStorage())
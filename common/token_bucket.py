@@ -0,0 +1,55 @@
+from typing import Generic, Hashable, TypeVar
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "stamp")
+
+    def __init__(self, tokens: float, stamp: float):
+        self.tokens = tokens
+        self.stamp = stamp
+
+    def refill(self, now: float, rate: float, burst: float) -> None:
+        self.tokens = min(burst, self.tokens + (now - self.stamp) * rate)
+        self.stamp = now
+
+    def wait_time(self, rate: float) -> float:
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / rate if rate else float("inf")
+
+
+K = TypeVar("K", bound=Hashable)
+B = TypeVar("B", bound=TokenBucket)
+
+
+class BucketTable(Generic[K, B]):
+    """
+    Token buckets with one rate and burst, keyed by chat. A key starts with a full bucket; buckets idle
+    long enough to be full again carry no state and are dropped by sweep().
+    """
+
+    def __init__(self, rate: float, burst: float, bucket_class: type[B] = TokenBucket):
+        self.rate = rate
+        self.burst = burst
+        self.bucket_class = bucket_class
+        self._buckets: dict[K, B] = {}
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def __getitem__(self, key: K) -> B:
+        return self._buckets[key]
+
+    def get(self, key: K, now: float) -> B:
+        """The key's bucket, refilled up to `now`."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = self.bucket_class(self.burst, now)
+        else:
+            bucket.refill(now, self.rate, self.burst)
+        return bucket
+
+    def sweep(self, now: float) -> None:
+        idle = self.burst / self.rate if self.rate else float("inf")
+        for key in [key for key, bucket in self._buckets.items() if now - bucket.stamp >= idle]:
+            del self._buckets[key]
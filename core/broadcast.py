@@ -0,0 +1,106 @@
+import re
+import html
+import shlex
+from dataclasses import dataclass
+
+from core import texts
+from services.db.dto import BroadcastRecipient
+
+
+def _first_name(r: BroadcastRecipient) -> str:
+    # Names are stored as "Фамилия Имя [Отчество]"
+    words = r.full_name.split()
+    return words[1] if len(words) > 1 else r.full_name
+
+
+PLACEHOLDERS = {
+    "full_name": lambda r: r.full_name,
+    "first_name": _first_name,
+    "status": lambda r: texts.registration.rsvp_status_labels.get(r.status or "registered", r.status),
+    "university": lambda r: r.university or "—",
+    "study_group": lambda r: r.study_group or "—",
+}
+
+
+# Only the known placeholders are substituted: any other brace (code, emoticons) is part of the text
+_PLACEHOLDER_RE = re.compile(r"\{(%s)\}" % "|".join(PLACEHOLDERS))
+
+
+class BroadcastTemplate:
+    """
+    A broadcast text with {placeholders}, compiled once into a plain positional format string.
+    Rendering then evaluates only the placeholders the text actually uses, HTML-escaped.
+    """
+
+    def __init__(self, text: str):
+        fields: list[str] = []
+        parts: list[str] = []
+        # re.split with a group alternates literal text and placeholder names
+        for i, part in enumerate(_PLACEHOLDER_RE.split(text)):
+            if i % 2 == 0:
+                parts.append(part.replace("{", "{{").replace("}", "}}"))
+                continue
+            if part not in fields:
+                fields.append(part)
+            parts.append("{%d}" % fields.index(part))
+        self.fields = tuple(fields)
+        self._format = "".join(parts).format
+        self._getters = tuple(PLACEHOLDERS[field] for field in fields)
+
+    @property
+    def is_personalized(self) -> bool:
+        return bool(self.fields)
+
+    def render(self, recipient: BroadcastRecipient) -> str:
+        return self._format(*[html.escape(getter(recipient), quote=False) for getter in self._getters])
+
+
+@dataclass
+class BroadcastAudience:
+    status: str | None = None
+    university: str | None = None
+    exclude_university: str | None = None
+
+    @property
+    def is_filtered(self) -> bool:
+        return any((self.status, self.university, self.exclude_university))
+
+
+AUDIENCE_KEYS = ("status", "mgtu", "university")
+MGTU_YES = ("yes", "да")
+MGTU_NO = ("no", "нет")
+
+
+class BroadcastArgsException(Exception):
+    pass
+
+
+def parse_broadcast_args(args: str) -> tuple[BroadcastAudience, str]:
+    """
+    The first line of the arguments is an audience filter when it consists of key=value pairs only:
+    status=<rsvp status>, mgtu=yes|no (да|нет), university="<name>". The rest is the message template.
+    Raises BroadcastArgsException on a filter value that cannot be interpreted.
+    """
+    first_line, _, rest = args.partition("\n")
+    try:
+        tokens = shlex.split(first_line)
+    except ValueError:
+        tokens = []
+    pairs = [token.partition("=") for token in tokens]
+    if not pairs or not all(sep and key in AUDIENCE_KEYS for key, sep, _ in pairs):
+        return BroadcastAudience(), args.strip()
+
+    audience = BroadcastAudience()
+    for key, _, value in pairs:
+        if key == "status":
+            audience.status = value
+        elif key == "university":
+            audience.university = value
+        elif value.lower() in MGTU_YES:
+            audience.university = texts.registration.mgtu_university
+        elif value.lower() in MGTU_NO:
+            audience.exclude_university = texts.registration.mgtu_university
+        else:
+            # A typo must not silently select the opposite audience
+            raise BroadcastArgsException(f"{key}={value}")
+    return audience, rest.strip()
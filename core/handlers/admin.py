@@ -1,91 +1,274 @@
 import io
 import csv
+import html
 from aiogram.dispatcher.filters import Command
 from aiogram.types import Message, InputFile, ParseMode
-import asyncio
 import os
+from typing import AsyncIterator
 
+from common import outbound
+from common.profiling import Profiler, ProfilerBusyException, ProfilerUnavailableException
 from common.repository import dp
+from services.db.dto import ExportRow
 from services.db.storage import Storage
 from core.filters.admin import AdminFilter
+from core.middlewares.throttling import ThrottlingMiddleware
 from config import config
 from datetime import datetime, timedelta
 from core import texts
+from core.broadcast import BroadcastTemplate, BroadcastArgsException, PLACEHOLDERS, parse_broadcast_args
 from core.handlers import keyboards
 
 
+RSVP_STATUSES = ("registered", "awaiting", "confirmed", "declined", "waitlisted", "invited", "expired")
+
+EXPORT_USAGE = "\n".join((
+    "Использование: /export [цель] [статус]",
+    "Без цели выгружаются все регистрации.",
+    "С целью (например, /export security) — только изменения с прошлой выгрузки для этой цели "
+    "(с запасом в несколько минут: часть строк может повториться).",
+    f"Статус RSVP ({', '.join(RSVP_STATUSES)}) ограничивает выгрузку участниками с этим статусом.",
+))
+
+
+async def registrations_csv(batches: AsyncIterator[list[ExportRow]]) -> tuple[InputFile, int]:
+    # Written batch by batch straight into the encoded buffer, so only one batch of rows is held at a time
+    file_obj = io.BytesIO()
+    buffer = io.TextIOWrapper(file_obj, encoding="utf-8", newline="")
+    writer = csv.writer(buffer)
+    writer.writerow(["id", "user_chat_id", "full_name", "passport_series", "passport_number", "university", "workplace", "created_on", "rsvp_status"])
+    count = 0
+    async for rows in batches:
+        count += len(rows)
+        writer.writerows(
+            (
+                r.id,
+                r.user_chat_id,
+                r.full_name,
+                r.passport_series,
+                r.passport_number,
+                r.university or "",
+                r.workplace or "",
+                r.created_on.isoformat() if r.created_on else "",
+                r.rsvp_status or "",
+            )
+            for r in rows
+        )
+    buffer.flush()
+    buffer.detach()
+    file_obj.seek(0)
+    return InputFile(file_obj, filename="registrations.csv"), count
+
+
 @dp.message_handler(AdminFilter(), Command("export"), state="*")
 async def export_registrations(message: Message, store: Storage):
-    regs = await store.list_registrations()
-    if not regs:
+    target = None
+    status = None
+    for arg in message.get_args().split():
+        if arg in RSVP_STATUSES and status is None:
+            status = arg
+        elif target is None:
+            target = arg
+        else:
+            return await message.answer(EXPORT_USAGE)
+
+    # Captured before the query, so rows changed while exporting get into the next delta; rows stamped
+    # earlier but committed after the query are covered by the overlap of the next delta
+    exported_at = datetime.now()
+    since = await store.get_export_watermark(target) if target else None
+    document, count = await registrations_csv(store.iter_registrations_for_export(since=since, status=status))
+    if not count:
+        if since is not None:
+            return await message.answer(f"Нет изменений с {since.strftime('%d.%m %H:%M')}.")
         return await message.answer("Пока нет регистраций.")
 
-    buffer = io.StringIO()
-    writer = csv.writer(buffer)
-    writer.writerow(["id", "user_chat_id", "full_name", "passport_series", "passport_number", "university", "workplace", "created_on"])
-    for r in regs:
-        writer.writerow([
-            r.id,
-            r.user_chat_id,
-            r.full_name,
-            r.passport_series,
-            r.passport_number,
-            r.university or "",
-            r.workplace or "",
-            r.created_on.isoformat() if getattr(r, "created_on", None) else "",
-        ])
-    data = buffer.getvalue().encode("utf-8")
-    file_obj = io.BytesIO(data)
-    file_obj.seek(0)
-    input_file = InputFile(file_obj, filename="registrations.csv")
-    await message.answer_document(input_file, caption="Список регистраций")
+    caption = "Список регистраций"
+    if status:
+        caption += f" со статусом {status}"
+    if since is not None:
+        caption += f", изменения с {since.strftime('%d.%m %H:%M')}"
+    await message.answer_document(document, caption=caption)
+    if target:
+        await store.save_export_watermark(target, exported_at)
+
+
+DUPLICATE_KINDS = {
+    "passport": "одинаковый паспорт",
+    "name_group": "одинаковые ФИО и группа",
+}
+DUPLICATES_SHOWN = 30
+
+
+@dp.message_handler(AdminFilter(), Command("duplicates"), state="*")
+async def duplicates(message: Message, store: Storage):
+    groups = await store.list_duplicates()
+    if not groups:
+        return await message.answer("Дубликатов не найдено.")
+    lines = [f"Найдено групп дубликатов: {len(groups)}"]
+    for group in groups[:DUPLICATES_SHOWN]:
+        lines.append("")
+        lines.append(f"{DUPLICATE_KINDS.get(group.kind, group.kind)} ({group.count}):")
+        lines.extend(f"  #{member}" for member in group.registrations)
+    if len(groups) > DUPLICATES_SHOWN:
+        lines.append("")
+        lines.append(f"…и ещё {len(groups) - DUPLICATES_SHOWN}")
+    text = "\n".join(lines)
+    if len(text) > 4000:
+        return await message.answer_document(
+            InputFile(io.BytesIO(text.encode("utf-8")), filename="duplicates.txt"), caption=lines[0],
+        )
+    await message.answer(text)
+
+
+FIND_LIMIT = 10
+
+
+@dp.message_handler(AdminFilter(), Command("find"), state="*")
+async def find(message: Message, store: Storage):
+    query = message.get_args().strip()
+    if not query:
+        return await message.answer("Использование: /find часть ФИО, группы или вуза")
+    results = await store.search_registrations(query, limit=FIND_LIMIT)
+    if not results:
+        return await message.answer("Ничего не найдено.")
+    lines = []
+    for r in results:
+        status = texts.registration.rsvp_status_labels.get(r.rsvp_status or "registered", r.rsvp_status)
+        where = r.study_group or r.university or "—"
+        lines.append(f"#{r.registration_id} {html.escape(r.full_name)} — {html.escape(where)} — <b>{status}</b>")
+    await message.answer("\n".join(lines), parse_mode=ParseMode.HTML)
 
 
 @dp.message_handler(AdminFilter(), Command("start_rsvp"), state="*")
 async def start_rsvp(message: Message, store: Storage):
-    regs = await store.list_registrations()
-    if not regs:
+    targets = await store.list_rsvp_targets()
+    if not targets:
         return await message.answer("Нет регистраций.")
     deadline = datetime.utcnow() + timedelta(hours=config.rsvp_window_hours)
     sent = 0
-    for r in regs:
-        rsvp = await store.ensure_rsvp(r.id)
-        if rsvp.status in ("confirmed", "declined"):
-            continue
-        await store.update_rsvp(r.id, status="awaiting", confirmation_deadline=deadline)
-        try:
-            await message.bot.send_message(r.user_chat_id, texts.registration.invite_rsvp, reply_markup=keyboards.yes_no_keyboard())
-            sent += 1
-        except Exception:
-            continue
+    with outbound.priority(outbound.Priority.RSVP):
+        for target in targets:
+            rsvp = await store.update_rsvp(
+                target.registration_id, status="awaiting", confirmation_deadline=deadline, unless_status=("confirmed", "declined"),
+            )
+            if rsvp is None:
+                continue
+            try:
+                await message.bot.send_message(target.chat_id, texts.registration.invite_rsvp, reply_markup=keyboards.yes_no_keyboard())
+                sent += 1
+            except Exception:
+                continue
     await message.answer(f"RSVP запущен. Отправлено: {sent}. Дедлайн: {deadline.strftime('%d.%m %H:%M')}")
 
 
 @dp.message_handler(AdminFilter(), Command("stats"), state="*")
-async def stats(message: Message, store: Storage):
+async def stats(message: Message, store: Storage, throttling: ThrottlingMiddleware | None = None):
     confirmed = await store.count_confirmed()
     total = await store.count_registrations()
-    await message.answer(f"Статистика:\nВсего регистраций: {total}\nПодтверждено: {confirmed}/{config.capacity}")
+    lines = [
+        "Статистика:",
+        f"Всего регистраций: {total}",
+        f"Подтверждено: {confirmed}/{config.capacity}",
+    ]
+    if throttling is not None:
+        lines.append(f"Отброшено из-за флуда: {sum(throttling.rejected.values())}")
+    scheduler = getattr(message.bot, "scheduler", None)
+    if scheduler is not None:
+        lines.append(f"Исходящая очередь: {scheduler.queued()}")
+    if hasattr(message.bot, "pool_stats"):
+        pool = message.bot.pool_stats()
+        lines.append(
+            f"Соединения Bot API: активных {pool['active']}, свободных {pool['idle']}, "
+            f"открыто {pool['created']}, ожиданий пула {pool['waits']} ({pool['wait_ms']} мс)"
+        )
+    await message.answer("\n".join(lines))
+
+
+PROFILE_DEFAULT_SECONDS = 30
+PROFILE_MAX_SECONDS = 600
+profiler = Profiler()
+
+
+PROFILE_USAGE = "\n".join((
+    f"Использование: /profile [секунды, до {PROFILE_MAX_SECONDS}] [cpu]",
+    "cpu — без отслеживания памяти (tracemalloc заметно замедляет бота и искажает замеры времени).",
+))
+
+
+@dp.message_handler(AdminFilter(), Command("profile"), state="*")
+async def profile(message: Message):
+    args = message.get_args().split()
+    memory = "cpu" not in args
+    args = [arg for arg in args if arg != "cpu"]
+    if len(args) > 1 or (args and not args[0].isdigit()):
+        return await message.answer(PROFILE_USAGE)
+    seconds = min(int(args[0]) if args else PROFILE_DEFAULT_SECONDS, PROFILE_MAX_SECONDS) or PROFILE_DEFAULT_SECONDS
+    if profiler.running:
+        return await message.answer("Профилирование уже идёт.")
+
+    await message.answer(f"Профилирование запущено на {seconds} с.")
+    try:
+        report = await profiler.run(seconds, memory=memory)
+    except ProfilerBusyException:
+        return await message.answer("Профилирование уже идёт.")
+    except ProfilerUnavailableException:
+        return await message.answer("Профилирование недоступно: нужен SIGPROF и event loop в главном потоке.")
+    file_obj = io.BytesIO(report.encode("utf-8"))
+    filename = f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.txt"
+    await message.answer_document(InputFile(file_obj, filename=filename))
+
+
+BROADCAST_USAGE = "\n".join((
+    "Использование: /broadcast текст сообщения",
+    "",
+    "В тексте можно использовать подстановки: " + ", ".join("{%s}" % name for name in PLACEHOLDERS) + ".",
+    "Первой строкой можно ограничить получателей: status=<статус RSVP> mgtu=yes|no (да|нет) university=\"<вуз>\"",
+    "Например:",
+    "/broadcast status=confirmed mgtu=no",
+    "{first_name}, не забудьте паспорт!",
+))
 
 
 @dp.message_handler(AdminFilter(), Command("broadcast"), state="*")
 async def broadcast(message: Message, store: Storage):
-    text = message.get_args().strip()
-    if not text:
-        return await message.answer("Использование: /broadcast текст сообщения")
-    chat_ids = await store.list_all_chat_ids()
-    if not chat_ids:
-        return await message.answer("Нет пользователей для рассылки.")
+    try:
+        audience, text = parse_broadcast_args(message.get_args())
+    except BroadcastArgsException:
+        return await message.answer(BROADCAST_USAGE)
+    if not text or (audience.status is not None and audience.status not in RSVP_STATUSES):
+        return await message.answer(BROADCAST_USAGE)
+    template = BroadcastTemplate(text)
+
     sent = 0
     failed = 0
-    for idx, chat_id in enumerate(chat_ids, start=1):
-        try:
-            await message.bot.send_message(chat_id, text, parse_mode=ParseMode.HTML)
-            sent += 1
-        except Exception:
-            failed += 1
-        if idx % 25 == 0:
-            await asyncio.sleep(0.05)
+    if not template.is_personalized and not audience.is_filtered:
+        # The same text for everyone who ever talked to the bot, registered or not
+        chat_ids = await store.list_all_chat_ids()
+        if not chat_ids:
+            return await message.answer("Нет пользователей для рассылки.")
+        with outbound.priority(outbound.Priority.BROADCAST):
+            for chat_id in chat_ids:
+                try:
+                    await message.bot.send_message(chat_id, text, parse_mode=ParseMode.HTML)
+                    sent += 1
+                except Exception:
+                    failed += 1
+        return await message.answer(f"Рассылка завершена. Отправлено: {sent}, ошибок: {failed}.")
+
+    with outbound.priority(outbound.Priority.BROADCAST):
+        async for batch in store.iter_broadcast_recipients(
+            status=audience.status,
+            university=audience.university,
+            exclude_university=audience.exclude_university,
+        ):
+            for recipient in batch:
+                try:
+                    await message.bot.send_message(recipient.chat_id, template.render(recipient), parse_mode=ParseMode.HTML)
+                    sent += 1
+                except Exception:
+                    failed += 1
+    if sent + failed == 0:
+        return await message.answer("Нет пользователей для рассылки.")
     await message.answer(f"Рассылка завершена. Отправлено: {sent}, ошибок: {failed}.")
 
 
@@ -126,19 +309,18 @@ async def send_instruction(message: Message, store: Storage):
         return await message.answer(f"Ошибка загрузки видео: {e}")
     sent = 0
     failed = 0
-    for idx, chat_id in enumerate(chat_ids, start=1):
-        try:
-            send_kwargs = {
-                "video": file_id,
-                "caption": INSTRUCTION_TEXT,
-                "parse_mode": ParseMode.HTML,
-            }
-            if preview_path and os.path.exists(preview_path):
-                send_kwargs["thumb"] = InputFile(preview_path)
-            await message.bot.send_video(chat_id, **send_kwargs)
-            sent += 1
-        except Exception:
-            failed += 1
-        if idx % 20 == 0:
-            await asyncio.sleep(0.1)
+    with outbound.priority(outbound.Priority.BROADCAST):
+        for chat_id in chat_ids:
+            try:
+                send_kwargs = {
+                    "video": file_id,
+                    "caption": INSTRUCTION_TEXT,
+                    "parse_mode": ParseMode.HTML,
+                }
+                if preview_path and os.path.exists(preview_path):
+                    send_kwargs["thumb"] = InputFile(preview_path)
+                await message.bot.send_video(chat_id, **send_kwargs)
+                sent += 1
+            except Exception:
+                failed += 1
     await message.answer(f"Рассылка инструкции завершена. Отправлено: {sent}, ошибок: {failed}.")
@@ -9,7 +9,9 @@ from datetime import datetime
 from core import texts
 from core import states
 from core.handlers import keyboards
+from common import outbound
 from common.repository import dp
+from services.db.rsvp_index import RsvpIndex
 from services.db.storage import Storage
 from config import config
 
@@ -116,7 +118,7 @@ async def handle_is_student(message: Message, state: FSMContext):
     if message.text == texts.buttons.yes:
         async with state.proxy() as data:
             data[DATA_MGTU_KEY] = True
-            data[DATA_UNIVERSITY_KEY] = "МГТУ им. Н. Э. Баумана"
+            data[DATA_UNIVERSITY_KEY] = texts.registration.mgtu_university
             data[DATA_PASSPORT_SERIES_KEY] = ""
             data[DATA_PASSPORT_NUMBER_KEY] = ""
         return await ask_study_group(message)
@@ -236,6 +238,17 @@ async def handle_confirm(message: Message, state: FSMContext, store: Storage):
         return await ask_workplace(message)
     if message.text == texts.buttons.yes:
         async with state.proxy() as data:
+            duplicate_id = await store.find_duplicate(
+                message.chat.id,
+                full_name=data[DATA_FULL_NAME_KEY],
+                passport_series=data[DATA_PASSPORT_SERIES_KEY],
+                passport_number=data[DATA_PASSPORT_NUMBER_KEY],
+                study_group=data.get(DATA_STUDY_GROUP_KEY),
+            )
+            if duplicate_id is not None:
+                logger.info("Rejected duplicate registration", extra={"chat_id": message.chat.id, "duplicate_of": duplicate_id})
+                await state.finish()
+                return await message.answer(texts.registration.duplicate_registration, reply_markup=ReplyKeyboardRemove())
             reg_id = data.get(DATA_REGISTRATION_ID_KEY)
             if reg_id:
                 await store.update_registration(
@@ -276,7 +289,7 @@ async def handle_consent(message: Message, state: FSMContext, store: Storage):
     return await message.answer(texts.errors.invalid_input_button)
 
 @dp.message_handler(ChatTypeFilter(ChatType.PRIVATE), state="*")
-async def handle_rsvp(message: Message, state: FSMContext, store: Storage):
+async def handle_rsvp(message: Message, state: FSMContext, store: Storage, rsvp_index: RsvpIndex):
     # Process RSVP yes/no if user is awaiting or invited
     # Ignore if user is inside any FSM state to avoid conflicts with Yes/No steps
     current_state = await state.get_state()
@@ -284,30 +297,30 @@ async def handle_rsvp(message: Message, state: FSMContext, store: Storage):
         return
     if message.text not in (texts.buttons.yes, texts.buttons.no):
         return
-    reg = await store.last_registration_by_chat(message.chat.id)
-    if not reg:
-        return
-    rsvp = await store.ensure_rsvp(reg.id)
-    if rsvp.status not in ("awaiting", "invited", "waitlisted"):
+    # Chats without a pending RSVP are rejected here, without a database round trip
+    pending = rsvp_index.get(message.chat.id)
+    if pending is None:
         return
+    registration_id, _ = pending
     if message.text == texts.buttons.yes:
         confirmed = await store.count_confirmed()
         if confirmed < config.capacity:
-            await store.update_rsvp(reg.id, status="confirmed", confirmed_at=datetime.utcnow())
+            await store.update_rsvp(registration_id, status="confirmed", confirmed_at=datetime.utcnow())
             await message.answer(texts.registration.confirmed_ok, reply_markup=ReplyKeyboardRemove())
         else:
             pos = await store.max_waitlist_position() + 1
-            await store.update_rsvp(reg.id, status="waitlisted", waitlist_position=pos)
+            await store.update_rsvp(registration_id, status="waitlisted", waitlist_position=pos)
             await message.answer(texts.registration.waitlisted_info.format(pos=pos), reply_markup=ReplyKeyboardRemove())
     else:
-        await store.update_rsvp(reg.id, status="declined")
+        await store.update_rsvp(registration_id, status="declined")
         await message.answer(texts.registration.declined_ok, reply_markup=ReplyKeyboardRemove())
         # Try invite next from waitlist
         nxt = await store.next_waitlist_candidate()
         if nxt:
             await store.update_rsvp(nxt.registration_id, status="invited")
             try:
-                target_reg = await store.get_registration(nxt.registration_id)
-                await message.bot.send_message(target_reg.user_chat_id, texts.registration.invited_from_waitlist, reply_markup=keyboards.yes_no_keyboard())
+                target_chat_id = rsvp_index.chat_id(nxt.registration_id)
+                with outbound.priority(outbound.Priority.RSVP):
+                    await message.bot.send_message(target_chat_id, texts.registration.invited_from_waitlist, reply_markup=keyboards.yes_no_keyboard())
             except Exception:
                 pass
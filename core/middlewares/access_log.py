@@ -0,0 +1,37 @@
+import time
+import logging
+
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram.types import Message
+
+
+logger = logging.getLogger("bot.access")
+
+DATA_STARTED_KEY = "_access_started"
+DATA_HANDLER_KEY = "_access_handler"
+
+
+class AccessLogMiddleware(BaseMiddleware):
+    """Logs one structured record per handled message: chat id, handler name and latency."""
+
+    async def on_pre_process_message(self, message: Message, data: dict):
+        data[DATA_STARTED_KEY] = time.perf_counter()
+
+    async def on_process_message(self, message: Message, data: dict):
+        handler = current_handler.get(None)
+        if handler is not None:
+            data[DATA_HANDLER_KEY] = handler.__name__
+
+    async def on_post_process_message(self, message: Message, results, data: dict):
+        started = data.get(DATA_STARTED_KEY)
+        if started is None or not logger.isEnabledFor(logging.INFO):
+            return
+        logger.info(
+            "Handled message",
+            extra={
+                "chat_id": message.chat.id,
+                "handler": data.get(DATA_HANDLER_KEY),
+                "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+            },
+        )
@@ -1,23 +1,34 @@
 from aiogram.dispatcher.middlewares import LifetimeControllerMiddleware
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from services.db.rsvp_index import RsvpIndex
+from services.db.search_index import SearchIndex
 from services.db.storage import Storage
 
 
 class DbMiddleware(LifetimeControllerMiddleware):
     skip_patterns = ["error", "update"]
 
-    def __init__(self, pool):
+    def __init__(self, pool, rsvp_index: RsvpIndex, replica_pool=None, search_index: SearchIndex | None = None):
         super().__init__()
         self.pool = pool
+        self.replica_pool = replica_pool
+        self.rsvp_index = rsvp_index
+        self.search_index = search_index
 
     async def pre_process(self, obj, data, *args):
         db: AsyncSession = self.pool()
+        replica: AsyncSession | None = self.replica_pool() if self.replica_pool else None
         data["db"] = db
-        data["store"] = Storage(db)
+        data["replica_db"] = replica
+        data["store"] = Storage(db, self.rsvp_index, replica, self.search_index)
+        data["rsvp_index"] = self.rsvp_index
 
     async def post_process(self, obj, data, *args):
         del data["store"]
         db = data.get("db")
         if db:
             await db.close()
+        replica = data.get("replica_db")
+        if replica:
+            await replica.close()
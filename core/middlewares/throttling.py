@@ -0,0 +1,110 @@
+import time
+import logging
+from collections import Counter
+
+from aiogram.dispatcher.handler import CancelHandler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram.types import Message
+
+from common.token_bucket import BucketTable, TokenBucket
+from core import texts
+
+
+logger = logging.getLogger(__name__)
+
+GROUP_DEFAULT = "default"
+GROUP_COMMAND = "command"
+GROUP_ANSWER = "answer"
+
+
+class _Bucket(TokenBucket):
+    __slots__ = ("warned",)
+
+    def __init__(self, tokens: float, stamp: float):
+        super().__init__(tokens, stamp)
+        self.warned = False
+
+
+class Limit:
+    __slots__ = ("rate", "burst")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+
+
+def parse_limits(value: str) -> dict[str, Limit]:
+    # Format: "group=rate:burst;...", rate in messages per second
+    limits = {}
+    for item in value.split(";"):
+        if not item.strip():
+            continue
+        group, _, spec = item.partition("=")
+        rate, _, burst = spec.partition(":")
+        limits[group.strip()] = Limit(float(rate), float(burst))
+    return limits
+
+
+def message_group(message: Message) -> str:
+    text = message.text or ""
+    if text.startswith("/"):
+        return GROUP_COMMAND
+    if text in (texts.buttons.yes, texts.buttons.no):
+        return GROUP_ANSWER
+    return GROUP_DEFAULT
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Per-chat token bucket for incoming messages. Must be set up before DbMiddleware:
+    rejected updates are cancelled in pre-process, so no DB session is opened for them.
+    """
+
+    def __init__(self, limits: dict[str, Limit], exempt_ids: list[int], sweep_interval: float = 60.0):
+        super().__init__()
+        self.limits = limits
+        self.exempt_ids = frozenset(exempt_ids)
+        self.sweep_interval = sweep_interval
+        self.rejected: Counter[str] = Counter()
+        self._buckets: dict[str, BucketTable[int, _Bucket]] = {
+            group: BucketTable(limit.rate, limit.burst, _Bucket) for group, limit in limits.items()
+        }
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def allow(self, chat_id: int, group: str, now: float) -> bool:
+        bucket = self._buckets[group].get(chat_id, now)
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            bucket.warned = False
+            return True
+        return False
+
+    def sweep(self, now: float) -> None:
+        for buckets in self._buckets.values():
+            buckets.sweep(now)
+
+    async def on_pre_process_message(self, message: Message, data: dict):
+        data["throttling"] = self
+        chat_id = message.chat.id
+        if chat_id in self.exempt_ids:
+            return
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self.sweep(now)
+            self._next_sweep = now + self.sweep_interval
+
+        group = message_group(message)
+        if group not in self.limits:
+            group = GROUP_DEFAULT
+            if group not in self.limits:
+                return
+        if self.allow(chat_id, group, now):
+            return
+
+        self.rejected[group] += 1
+        bucket = self._buckets[group][chat_id]
+        if not bucket.warned:
+            bucket.warned = True
+            logger.warning("Flood limit exceeded", extra={"chat_id": chat_id, "group": group})
+            await message.answer(texts.errors.too_many_requests)
+        raise CancelHandler()
@@ -1,2 +1,3 @@
 invalid_input_button = "Выберите, пожалуйста, один из предложенных вариантов."
 unknown = "Мы не понимаем, что вы хотите сделать :("
+too_many_requests = "Слишком много сообщений. Подождите немного и попробуйте снова."
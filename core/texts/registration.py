@@ -1,3 +1,5 @@
+mgtu_university = "МГТУ им. Н. Э. Баумана"
+
 intro = "\n".join((
     "🎉 Добро пожаловать! Здесь можно пройти регистрацию на мероприятие ITS BMSTU x StepOne C# Meetup!",
     "",
@@ -63,6 +65,7 @@ invited_from_waitlist = "Освободилось место! Подтверди
 
 edit_flow_cancelled = "Хорошо. Если захотите изменить данные — отправьте /start."
 registration_finished = "✅ Регистрация завершена! Спасибо. Примерно за неделю до мероприятия мы вышлем вам уведомление о подтверждении участия, поэтому, пожалуйста, не блокируйте бота."
+duplicate_registration = "⚠️ Участник с такими данными уже зарегистрирован с другого аккаунта. Если это ошибка, пожалуйста, напишите организаторам."
 
 registration_closed_non_bmstu = "\n".join((
     "⏰ Регистрация для участников, не обучающихся в МГТУ им. Н. Э. Баумана, закрылась 24 ноября в 20:00.",
@@ -85,3 +88,13 @@ def review(full_name: str, passport_series: str, passport_number: str, universit
     lines.append(f"🏢 Работа: {work}")
     return "\n".join(lines)
 
+
+rsvp_status_labels = {
+    "registered": "зарегистрирован(а)",
+    "awaiting": "ожидаем подтверждения",
+    "confirmed": "участие подтверждено",
+    "declined": "отказ от участия",
+    "waitlisted": "в листе ожидания",
+    "invited": "приглашён(а) из листа ожидания",
+    "expired": "подтверждение просрочено",
+}
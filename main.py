@@ -1,4 +1,3 @@
-import os
 import asyncio
 import logging
 
@@ -6,9 +5,15 @@ from aiogram import Bot
 from aiogram.types import BotCommand
 from sqlalchemy.orm import sessionmaker
 
+from common.log import setup_logging, parse_sampling
 from common.repository import bot, dp, config
+from core.middlewares.access_log import AccessLogMiddleware
 from core.middlewares.db import DbMiddleware
-from services.db.db_pool import create_db_pool
+from core.middlewares.throttling import ThrottlingMiddleware, parse_limits
+from services.db.db_pool import create_db_pool, create_replica_pool, close_db_pool, is_sqlite
+from services.db.rsvp_index import RsvpIndex
+from services.db.search_index import SearchIndex
+from services.db.storage import Storage
 from core.filters.admin import AdminFilter
 
 # NOT REMOVE THIS IMPORT!
@@ -26,23 +31,41 @@ async def set_commands(bot: Bot):
 
 
 async def main():
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
-        encoding="UTF-8",
-        handlers=[
-            #logging.FileHandler(os.path.join(config.logs_dir, "bot.log")),
-            logging.StreamHandler()
-        ]
+    setup_logging(
+        level=config.log_level,
+        fmt=config.log_format,
+        output=config.log_output,
+        logs_dir=config.logs_dir,
+        max_bytes=config.log_max_bytes,
+        backup_count=config.log_backup_count,
+        sampling=parse_sampling(config.log_sampling),
     )
     logger.info("Starting bot")
 
     db_pool: sessionmaker = await create_db_pool(config.db_uri)
+    replica_pool: sessionmaker | None = await create_replica_pool(config.db_replica_uri) if config.db_replica_uri else None
+    rsvp_index = RsvpIndex()
+    async with db_pool() as session:
+        await rsvp_index.load(session)
+    logger.info("Loaded %d pending RSVPs", len(rsvp_index))
+    async with db_pool() as session:
+        backfilled = await Storage(session).backfill_identities()
+    if backfilled:
+        logger.info("Indexed identities of %d existing registrations", backfilled)
+    # Postgres searches with pg_trgm indexes; SQLite gets an in-memory trigram index
+    search_index = SearchIndex() if is_sqlite(config.db_uri) else None
+    if search_index is not None:
+        async with db_pool() as session:
+            await search_index.load(session)
+        logger.info("Indexed %d registrations for search", len(search_index))
 
     await set_commands(bot)
     bot_obj = await bot.get_me()
-    logger.info(f"Bot username: {bot_obj.username}")
-    dp.middleware.setup(DbMiddleware(db_pool))
+    logger.info("Bot username: %s", bot_obj.username)
+    dp.middleware.setup(AccessLogMiddleware())
+    # Must go before DbMiddleware so flooded updates never open a session
+    dp.middleware.setup(ThrottlingMiddleware(parse_limits(config.flood_limits), exempt_ids=config.admin_ids))
+    dp.middleware.setup(DbMiddleware(db_pool, rsvp_index, replica_pool, search_index))
     dp.filters_factory.bind(AdminFilter)
 
     try:
@@ -51,6 +74,9 @@ async def main():
         await dp.storage.close()
         await dp.storage.wait_closed()
         await bot.session.close()
+        await close_db_pool(db_pool)
+        if replica_pool:
+            await close_db_pool(replica_pool)
 
 
 if __name__ == "__main__":
@@ -1,28 +1,130 @@
+import os
+import asyncio
 import logging
+from datetime import datetime
 
+from sqlalchemy import event, text, inspect, delete, select, func, and_, or_, exists
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.pool import NullPool
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, aliased
 
+from services.db import models
 from services.db.base import Base
 
 logger = logging.getLogger(__name__)
 
+# Session.info key of the lock serializing write transactions on backends with a single writer
+WRITE_LOCK_KEY = "write_lock"
 
-async def create_db_pool(uri: str):
-    engine = create_async_engine(
-        uri,
-        echo=False,
-        future=True,
-        poolclass=NullPool,
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    # Durable across application crashes in WAL mode; only an OS crash can lose the last commits
+    "PRAGMA synchronous=NORMAL",
+    # Negative value is in KiB: 64 MiB page cache per connection
+    "PRAGMA cache_size=-65536",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA foreign_keys=ON",
+)
+
+
+def is_sqlite(uri: str) -> bool:
+    return make_url(uri).get_backend_name() == "sqlite"
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def dedupe_rsvps(conn) -> None:
+    # Before the unique index on registration_id existed, a double answer could insert a second RSVP row.
+    # Keeps the most recently updated row per registration, so the index can be built. Runs only while
+    # the index is missing: once it exists there is nothing to dedupe
+    table = models.RegistrationRsvp.__table__
+    index = "ux_registrations_rsvp_registration_id"
+    if not inspect(conn).has_table(table.name):
+        return
+    if any(existing["name"] == index for existing in inspect(conn).get_indexes(table.name)):
+        return
+
+    def changed(model):
+        return func.coalesce(model.updated_on, model.created_on, datetime(1970, 1, 1))
+
+    newer = aliased(models.RegistrationRsvp)
+    current = models.RegistrationRsvp
+    stmt = delete(current).where(exists(select(newer.id).where(
+        newer.registration_id == current.registration_id,
+        or_(
+            changed(newer) > changed(current),
+            and_(changed(newer) == changed(current), newer.id > current.id),
+        ),
+    )))
+    deleted = conn.execute(stmt).rowcount
+    if deleted:
+        logger.warning("Removed %d duplicate RSVP rows before creating %s", deleted, index)
+
+
+def create_missing_indexes(conn) -> None:
+    # create_all skips tables that already exist, together with their indexes
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def create_engine(uri: str):
+    if not is_sqlite(uri):
+        return create_async_engine(
+            uri,
+            echo=False,
+            future=True,
+            poolclass=NullPool,
+        )
+
+    database = make_url(uri).database
+    if database and database != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(database)), exist_ok=True)
+    # An embedded database has no connection cost worth a NullPool: keep connections (and their page caches) open
+    engine = create_async_engine(uri, echo=False, future=True)
+    event.listen(engine.sync_engine, "connect", set_sqlite_pragmas)
+    return engine
+
+
+def create_sessionmaker(engine, uri: str) -> sessionmaker:
+    info = {}
+    if is_sqlite(uri):
+        # SQLite allows one writer at a time: queue write transactions in-process instead of
+        # letting them collide on the database lock and spin in busy_timeout
+        info[WRITE_LOCK_KEY] = asyncio.Lock()
+    return sessionmaker(
+        engine, expire_on_commit=False, class_=AsyncSession, info=info
     )
 
+
+async def create_db_pool(uri: str):
+    engine = create_engine(uri)
+
     async with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # Needed by the trigram indexes; a trusted extension, so the database owner may create it
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(dedupe_rsvps)
+        await conn.run_sync(create_missing_indexes)
+
+    return create_sessionmaker(engine, uri)
+
+
+async def create_replica_pool(uri: str):
+    # The schema is owned by the primary: a replica is only ever read from
+    engine = create_engine(uri)
+
+    return create_sessionmaker(engine, uri)
 
-    async_sessionmaker = sessionmaker(
-        engine, expire_on_commit=False, class_=AsyncSession
-    )
 
-    return async_sessionmaker
+async def close_db_pool(pool: sessionmaker) -> None:
+    await pool.kw["bind"].dispose()
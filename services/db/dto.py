@@ -0,0 +1,43 @@
+from datetime import datetime
+from typing import NamedTuple
+
+
+class BroadcastRecipient(NamedTuple):
+    chat_id: int
+    full_name: str
+    university: str | None
+    study_group: str | None
+    status: str | None
+
+
+class ExportRow(NamedTuple):
+    id: int
+    user_chat_id: int
+    full_name: str
+    passport_series: str
+    passport_number: str
+    university: str | None
+    workplace: str | None
+    created_on: datetime | None
+    rsvp_status: str | None
+
+
+class RsvpTarget(NamedTuple):
+    registration_id: int
+    chat_id: int
+
+
+class DuplicateGroup(NamedTuple):
+    kind: str
+    count: int
+    # "<registration id> <full name>" of each registration sharing the identity
+    registrations: list[str]
+
+
+class SearchResult(NamedTuple):
+    registration_id: int
+    user_chat_id: int
+    full_name: str
+    study_group: str | None
+    university: str | None
+    rsvp_status: str | None
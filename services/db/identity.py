@@ -0,0 +1,40 @@
+import re
+import hashlib
+
+
+PASSPORT = "passport"
+NAME_GROUP = "name_group"
+
+_DASHES = str.maketrans({"–": "-", "—": "-", "‐": "-", "−": "-"})
+
+
+def _digest(kind: str, value: str) -> str:
+    # Fixed-length keys whatever the source values. Not a protection of the passport data: an unsalted hash of
+    # ten digits is trivially reversed, and the registrations table holds the passport anyway
+    return f"{kind}:{hashlib.sha256(value.encode('utf-8')).hexdigest()}"
+
+
+def normalize_name(full_name: str) -> str:
+    return " ".join(re.findall(r"\w+", full_name.casefold().replace("ё", "е")))
+
+
+def normalize_group(study_group: str) -> str:
+    return "".join(study_group.upper().translate(_DASHES).split())
+
+
+def identity_keys(
+    *,
+    full_name: str,
+    passport_series: str | None,
+    passport_number: str | None,
+    study_group: str | None,
+) -> list[str]:
+    """Keys under which a person is recognised across chats: the passport, and the name within a study group."""
+    keys = []
+    passport = re.sub(r"\D", "", f"{passport_series or ''}{passport_number or ''}")
+    if passport:
+        keys.append(_digest(PASSPORT, passport))
+    name = normalize_name(full_name)
+    if name and study_group:
+        keys.append(_digest(NAME_GROUP, f"{name}|{normalize_group(study_group)}"))
+    return keys
@@ -1,10 +1,14 @@
 from datetime import datetime
 
-from sqlalchemy import Column, BigInteger, DateTime, Text, Sequence, ForeignKey, Integer
+from sqlalchemy import Column, BigInteger, DateTime, Text, Sequence, ForeignKey, Integer, Index
 
 from services.db.base import Base
 
 
+# SQLite only auto-increments INTEGER PRIMARY KEY columns
+BigIntegerPK = BigInteger().with_variant(Integer, "sqlite")
+
+
 class BaseModel(Base):
     __abstract__ = True
 
@@ -14,8 +18,21 @@ class BaseModel(Base):
 
 class Registration(BaseModel):
     __tablename__ = "registrations"
-
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    __table_args__ = (
+        # Incremental exports select rows changed since the last watermark
+        Index("ix_registrations_updated_on", "updated_on"),
+        Index("ix_registrations_user_chat_id", "user_chat_id"),
+        # Trigram indexes for /find (pg_trgm); SQLite searches an in-memory index instead
+        *(
+            Index(
+                f"ix_registrations_{column}_trgm", column,
+                postgresql_using="gin", postgresql_ops={column: "gin_trgm_ops"},
+            ).ddl_if(dialect="postgresql")
+            for column in ("full_name", "study_group", "university")
+        ),
+    )
+
+    id = Column(BigIntegerPK, primary_key=True, autoincrement=True)
 
     user_chat_id     = Column(BigInteger, nullable=False)
     full_name        = Column(Text,      nullable=False)
@@ -28,8 +45,14 @@ class Registration(BaseModel):
 
 class RegistrationRsvp(BaseModel):
     __tablename__ = "registrations_rsvp"
-
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    __table_args__ = (
+        # One RSVP per registration; also the conflict target of Storage.update_rsvp upserts
+        Index("ux_registrations_rsvp_registration_id", "registration_id", unique=True),
+        Index("ix_registrations_rsvp_status", "status"),
+        Index("ix_registrations_rsvp_updated_on", "updated_on"),
+    )
+
+    id = Column(BigIntegerPK, primary_key=True, autoincrement=True)
     registration_id = Column(ForeignKey("registrations.id", ondelete="CASCADE"), nullable=False)
 
     # status: registered | awaiting | confirmed | declined | waitlisted | invited | expired
@@ -45,3 +68,21 @@ class UserConsent(BaseModel):
 
     chat_id     = Column(BigInteger, primary_key=True)
     accepted_at = Column(DateTime,   nullable=False, default=datetime.utcnow)
+
+
+class ExportWatermark(BaseModel):
+    __tablename__ = "export_watermarks"
+
+    target      = Column(Text,     primary_key=True)
+    exported_at = Column(DateTime, nullable=False)
+
+
+class RegistrationIdentity(BaseModel):
+    __tablename__ = "registration_identities"
+
+    # Hashed identity key (see services.db.identity) of a chat's latest registration. The key leads the
+    # primary key, so a lookup by key is an index probe; the same person registered from several chats
+    # is one key with several rows
+    identity_key    = Column(Text,       primary_key=True)
+    user_chat_id    = Column(BigInteger, primary_key=True)
+    registration_id = Column(ForeignKey("registrations.id", ondelete="CASCADE"), nullable=False)
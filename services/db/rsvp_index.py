@@ -0,0 +1,64 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from services.db import models
+
+
+PENDING_STATUSES = ("awaiting", "invited", "waitlisted")
+
+
+class RsvpIndex:
+    """
+    In-memory map of chat id -> (registration id, status) for registrations waiting for an RSVP answer.
+    Loaded once at startup and kept current by Storage on every RSVP write, so incoming messages
+    from chats without a pending RSVP can be rejected without touching the database.
+    """
+
+    def __init__(self):
+        self._by_chat: dict[int, tuple[int, str]] = {}
+        self._chat_by_registration: dict[int, int] = {}
+
+    async def load(self, session: AsyncSession) -> None:
+        stmt = (
+            select(models.Registration.id, models.Registration.user_chat_id, models.RegistrationRsvp.status)
+            .join(models.RegistrationRsvp, models.RegistrationRsvp.registration_id == models.Registration.id)
+            .where(models.RegistrationRsvp.status.in_(PENDING_STATUSES))
+            .order_by(models.Registration.created_on.asc())
+        )
+        result = await session.execute(stmt)
+        self.clear()
+        for registration_id, chat_id, status in result:
+            self._put(int(chat_id), int(registration_id), status)
+
+    def __len__(self) -> int:
+        return len(self._by_chat)
+
+    def get(self, chat_id: int) -> tuple[int, str] | None:
+        return self._by_chat.get(chat_id)
+
+    def chat_id(self, registration_id: int) -> int | None:
+        return self._chat_by_registration.get(registration_id)
+
+    def set_status(self, registration_id: int, status: str, chat_id: int | None = None) -> None:
+        if status not in PENDING_STATUSES:
+            self.discard(registration_id)
+            return
+        if chat_id is None:
+            chat_id = self._chat_by_registration[registration_id]
+        self._put(chat_id, registration_id, status)
+
+    def discard(self, registration_id: int) -> None:
+        chat_id = self._chat_by_registration.pop(registration_id, None)
+        if chat_id is not None and self._by_chat.get(chat_id, (None,))[0] == registration_id:
+            del self._by_chat[chat_id]
+
+    def clear(self) -> None:
+        self._by_chat.clear()
+        self._chat_by_registration.clear()
+
+    def _put(self, chat_id: int, registration_id: int, status: str) -> None:
+        previous = self._by_chat.get(chat_id)
+        if previous is not None and previous[0] != registration_id:
+            self._chat_by_registration.pop(previous[0], None)
+        self._by_chat[chat_id] = (registration_id, status)
+        self._chat_by_registration[registration_id] = chat_id
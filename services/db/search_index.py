@@ -0,0 +1,170 @@
+import re
+import math
+from functools import lru_cache
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from services.db import models
+
+
+# Share of the query's trigrams a registration must contain to be a match
+MIN_SCORE = 0.5
+# Matches tied at the last place taken are ranked by text length among this many per result slot
+TIE_POOL_FACTOR = 10
+
+
+def normalize(text: str) -> list[str]:
+    return re.findall(r"\w+", text.casefold().replace("ё", "е"))
+
+
+@lru_cache(maxsize=65536)
+def _word_trigrams(word: str, closed: bool) -> tuple[str, ...]:
+    padded = f"  {word} " if closed else f"  {word}"
+    return tuple(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def trigrams(text: str, *, prefix: bool = False) -> set[str]:
+    # Words are padded as in pg_trgm: two spaces in front, one behind. With `prefix` the last word
+    # is left open at the end, so a partially typed word matches the words it begins
+    words = normalize(text)
+    grams = set()
+    for i, word in enumerate(words):
+        grams.update(_word_trigrams(word, not prefix or i < len(words) - 1))
+    return grams
+
+
+def document_text(full_name: str, study_group: str | None, university: str | None) -> str:
+    return " ".join((full_name, study_group or "", university or ""))
+
+
+class SearchIndex:
+    """
+    In-memory trigram index over registration names, groups and universities, for backends without
+    pg_trgm. Loaded once at startup and kept current by Storage on every registration write.
+
+    Each trigram has a posting list of registration ids. A query turns the posting lists of its trigrams
+    into bitmaps (Python ints, bit = registration id) and adds them up bit-sliced, so counting matches
+    over the whole index is a few dozen big-int operations instead of a dictionary update per posting.
+    Bitmaps of frequent trigrams are cached: they are smaller than their lists anyway.
+    """
+
+    def __init__(self):
+        self._postings: dict[str, list[int]] = {}
+        self._bitmaps: dict[str, int] = {}
+        self._texts: dict[int, str] = {}
+
+    async def load(self, session: AsyncSession) -> None:
+        stmt = select(
+            models.Registration.id,
+            models.Registration.full_name,
+            models.Registration.study_group,
+            models.Registration.university,
+        )
+        result = await session.execute(stmt)
+        self.clear()
+        for registration_id, full_name, study_group, university in result:
+            self.put(registration_id, full_name, study_group, university)
+        # Builds the bitmaps worth caching now rather than on the first lookups
+        for gram in list(self._postings):
+            self._bitmap(gram)
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def put(self, registration_id: int, full_name: str, study_group: str | None, university: str | None) -> None:
+        text = document_text(full_name, study_group, university)
+        previous = self._texts.get(registration_id)
+        if previous == text:
+            return
+        if previous is not None:
+            self.discard(registration_id)
+        self._texts[registration_id] = text
+        bit = 1 << registration_id
+        for gram in trigrams(text):
+            postings = self._postings.get(gram)
+            if postings is None:
+                postings = self._postings[gram] = []
+            postings.append(registration_id)
+            if gram in self._bitmaps:
+                self._bitmaps[gram] |= bit
+
+    def discard(self, registration_id: int) -> None:
+        text = self._texts.pop(registration_id, None)
+        if text is None:
+            return
+        bit = 1 << registration_id
+        for gram in trigrams(text):
+            postings = self._postings[gram]
+            postings.remove(registration_id)
+            if not postings:
+                del self._postings[gram]
+                self._bitmaps.pop(gram, None)
+            elif gram in self._bitmaps:
+                self._bitmaps[gram] &= ~bit
+
+    def clear(self) -> None:
+        self._postings.clear()
+        self._bitmaps.clear()
+        self._texts.clear()
+
+    def _bitmap(self, gram: str) -> int:
+        bitmap = self._bitmaps.get(gram)
+        if bitmap is not None:
+            return bitmap
+        postings = self._postings.get(gram)
+        if not postings:
+            return 0
+        buffer = bytearray(max(postings) // 8 + 1)
+        for registration_id in postings:
+            buffer[registration_id >> 3] |= 1 << (registration_id & 7)
+        bitmap = int.from_bytes(buffer, "little")
+        # Worth keeping when the bitmap is no bigger than the list: an id per 64 bits of bitmap or denser
+        if len(postings) * 64 >= len(buffer) * 8:
+            self._bitmaps[gram] = bitmap
+        return bitmap
+
+    def search(self, query: str, limit: int) -> list[int]:
+        """Registration ids by descending number of matched query trigrams; shorter texts win ties."""
+        grams = trigrams(query, prefix=True)
+        if not grams:
+            return []
+
+        # planes[i] holds bit i of every registration's match count
+        planes: list[int] = []
+        for gram in grams:
+            carry = self._bitmap(gram)
+            for i, plane in enumerate(planes):
+                if not carry:
+                    break
+                planes[i], carry = plane ^ carry, plane & carry
+            if carry:
+                planes.append(carry)
+        if not planes:
+            return []
+
+        results: list[int] = []
+        texts = self._texts
+        needed = math.ceil(len(grams) * MIN_SCORE)
+        for level in range(min(len(grams), 2 ** len(planes) - 1), needed - 1, -1):
+            mask = -1
+            for i, plane in enumerate(planes):
+                mask &= plane if level >> i & 1 else ~plane
+            if mask <= 0:
+                continue
+            # Ties at the last level taken are ranked among a bounded pool
+            ids = _bit_positions(mask, limit * TIE_POOL_FACTOR)
+            ids.sort(key=lambda registration_id: len(texts[registration_id]))
+            results.extend(ids[:limit - len(results)])
+            if len(results) >= limit:
+                break
+        return results
+
+
+def _bit_positions(mask: int, limit: int) -> list[int]:
+    positions = []
+    while mask and len(positions) < limit:
+        low = mask & -mask
+        positions.append(low.bit_length() - 1)
+        mask ^= low
+    return positions
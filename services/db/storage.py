@@ -1,12 +1,34 @@
+import re
 import logging
+from contextlib import asynccontextmanager, nullcontext
+from datetime import datetime, timedelta
+from typing import AsyncIterator
 
-from sqlalchemy import select, delete, func
+from sqlalchemy import Text, select, update, delete, func, and_, or_, exists, literal_column
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
 from services.db import models
+from services.db.dto import BroadcastRecipient, DuplicateGroup, ExportRow, RsvpTarget, SearchResult
+from services.db.db_pool import WRITE_LOCK_KEY
+from services.db.identity import identity_keys
+from services.db.rsvp_index import RsvpIndex
+from services.db.search_index import SearchIndex
 
 logger = logging.getLogger(__name__)
 
+# Dialect-specific INSERT constructs: both support ON CONFLICT and RETURNING
+_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+# updated_on is stamped by the application before the commit, so a row may become visible after an export
+# that started later than its timestamp. Deltas reach this far behind the watermark; re-sent rows are harmless
+EXPORT_WATERMARK_OVERLAP = timedelta(minutes=5)
+
 
 class RegistrationNotFoundException(Exception):
     def __init__(self, registration_id: int):
@@ -15,9 +37,53 @@ class RegistrationNotFoundException(Exception):
 
 class Storage:
     _db: AsyncSession
+    _replica: AsyncSession | None
+    _rsvp_index: RsvpIndex | None
+    _search_index: SearchIndex | None
 
-    def __init__(self, conn: AsyncSession):
+    def __init__(
+        self,
+        conn: AsyncSession,
+        rsvp_index: RsvpIndex | None = None,
+        replica: AsyncSession | None = None,
+        search_index: SearchIndex | None = None,
+    ):
         self._db = conn
+        self._replica = replica
+        self._rsvp_index = rsvp_index
+        self._search_index = search_index
+        self._wrote = False
+
+    @property
+    def _read_db(self) -> AsyncSession:
+        # Heavy read-only queries go to the replica, unless this Storage has already written:
+        # reads after a write in the same request must see it
+        if self._replica is None or self._wrote:
+            return self._db
+        return self._replica
+
+    def _insert(self, model):
+        return _INSERTS[self._db.bind.dialect.name](model)
+
+    @asynccontextmanager
+    async def _transaction(self):
+        # Statements executed inside are committed together, queued behind other writers on single-writer backends.
+        # The connection is checked out before queueing: a lock holder waiting for a pooled connection
+        # held by a queued writer would deadlock
+        await self._db.connection()
+        async with self._db.info.get(WRITE_LOCK_KEY) or nullcontext():
+            try:
+                yield
+                await self._db.commit()
+            except BaseException:
+                # Released together with the lock: the next writer must not find this transaction still open
+                await self._db.rollback()
+                raise
+        self._wrote = True
+
+    async def _write(self, stmt, **kwargs):
+        async with self._transaction():
+            return await self._db.execute(stmt, **kwargs)
 
     async def save_registration(
         self,
@@ -30,7 +96,7 @@ class Storage:
         workplace: str | None,
         study_group: str | None = None,
     ) -> int:
-        model = models.Registration(
+        stmt = self._insert(models.Registration).values(
             user_chat_id=user_chat_id,
             full_name=full_name,
             passport_series=passport_series,
@@ -38,12 +104,17 @@ class Storage:
             university=university,
             workplace=workplace,
             study_group=study_group,
+        ).returning(models.Registration.id)
+        keys = identity_keys(
+            full_name=full_name, passport_series=passport_series, passport_number=passport_number, study_group=study_group,
         )
-        self._db.add(model)
-        await self._db.commit()
-        await self._db.refresh(model)
-        logger.info(f"Saved registration for chat id {user_chat_id}")
-        return int(model.id)
+        async with self._transaction():
+            registration_id = (await self._db.execute(stmt)).scalar_one()
+            await self._replace_identities(user_chat_id, registration_id, keys)
+        if self._search_index is not None:
+            self._search_index.put(registration_id, full_name, study_group, university)
+        logger.info("Saved registration", extra={"chat_id": user_chat_id})
+        return int(registration_id)
 
     async def get_registration(self, registration_id: int) -> models.Registration:
         stmt = select(models.Registration).filter_by(id=registration_id)
@@ -55,9 +126,54 @@ class Storage:
 
     async def list_registrations(self) -> list[models.Registration]:
         stmt = select(models.Registration).order_by(models.Registration.created_on.desc())
-        result = await self._db.execute(stmt)
+        result = await self._read_db.execute(stmt)
         return list(result.scalars().all())
 
+    async def list_rsvp_targets(self) -> list[RsvpTarget]:
+        # Materialized rather than streamed: callers write an RSVP per target on the same session
+        stmt = select(models.Registration.id, models.Registration.user_chat_id).order_by(
+            models.Registration.created_on.desc()
+        )
+        result = await self._read_db.execute(stmt)
+        return [RsvpTarget._make(row) for row in result]
+
+    async def iter_registrations_for_export(
+        self,
+        *,
+        since: datetime | None = None,
+        status: str | None = None,
+        batch_size: int = 1000,
+    ) -> AsyncIterator[list[ExportRow]]:
+        # Plain columns, not entities: no identity map or per-object state for tens of thousands of rows
+        stmt = select(
+            models.Registration.id,
+            models.Registration.user_chat_id,
+            models.Registration.full_name,
+            models.Registration.passport_series,
+            models.Registration.passport_number,
+            models.Registration.university,
+            models.Registration.workplace,
+            models.Registration.created_on,
+            models.RegistrationRsvp.status,
+        ).outerjoin(
+            models.RegistrationRsvp, models.RegistrationRsvp.registration_id == models.Registration.id,
+        )
+        if status is not None:
+            stmt = stmt.where(models.RegistrationRsvp.status == status)
+        if since is not None:
+            since -= EXPORT_WATERMARK_OVERLAP
+            changed = models.Registration.updated_on > since
+            if status is not None:
+                # A registration whose RSVP has just reached the status is a change for this export too
+                changed = or_(changed, models.RegistrationRsvp.updated_on > since)
+            stmt = stmt.where(changed)
+        stmt = stmt.order_by(models.Registration.created_on.desc())
+        # Deltas are read from the primary: a lagging replica could hide rows older than the next watermark
+        db = self._db if since is not None else self._read_db
+        result = await db.stream(stmt.execution_options(yield_per=batch_size))
+        async for rows in result.partitions():
+            yield [ExportRow._make(row) for row in rows]
+
     async def update_registration(
         self,
         registration_id: int,
@@ -69,14 +185,26 @@ class Storage:
         workplace: str | None,
         study_group: str | None = None,
     ) -> None:
-        model = await self.get_registration(registration_id)
-        model.full_name = full_name
-        model.passport_series = passport_series
-        model.passport_number = passport_number
-        model.university = university
-        model.workplace = workplace
-        model.study_group = study_group
-        await self._db.commit()
+        stmt = update(models.Registration).where(
+            models.Registration.id == registration_id
+        ).values(
+            full_name=full_name,
+            passport_series=passport_series,
+            passport_number=passport_number,
+            university=university,
+            workplace=workplace,
+            study_group=study_group,
+        ).returning(models.Registration.user_chat_id)
+        keys = identity_keys(
+            full_name=full_name, passport_series=passport_series, passport_number=passport_number, study_group=study_group,
+        )
+        async with self._transaction():
+            chat_id = (await self._db.execute(stmt)).scalar_one_or_none()
+            if chat_id is None:
+                raise RegistrationNotFoundException(registration_id)
+            await self._replace_identities(chat_id, registration_id, keys)
+        if self._search_index is not None:
+            self._search_index.put(registration_id, full_name, study_group, university)
 
     async def last_registration_by_chat(self, chat_id: int) -> models.Registration | None:
         stmt = select(models.Registration).filter_by(user_chat_id=chat_id).order_by(models.Registration.created_on.desc())
@@ -85,12 +213,153 @@ class Storage:
 
     async def count_registrations(self) -> int:
         stmt = select(func.count(models.Registration.id))
-        result = await self._db.execute(stmt)
+        result = await self._read_db.execute(stmt)
         return int(result.scalar_one() or 0)
 
     async def clear_registrations(self) -> None:
-        await self._db.execute(delete(models.Registration))
-        await self._db.commit()
+        await self._write(delete(models.Registration))
+        if self._rsvp_index is not None:
+            self._rsvp_index.clear()
+        if self._search_index is not None:
+            self._search_index.clear()
+
+    # Search
+    async def search_registrations(self, query: str, limit: int = 10) -> list[SearchResult]:
+        """Best matches of a partial name, group or university, with their RSVP status."""
+        query = query.strip()
+        if not query:
+            return []
+        columns = (models.Registration.full_name, models.Registration.study_group, models.Registration.university)
+        stmt = select(
+            models.Registration.id,
+            models.Registration.user_chat_id,
+            models.Registration.full_name,
+            models.Registration.study_group,
+            models.Registration.university,
+            models.RegistrationRsvp.status,
+        ).outerjoin(
+            models.RegistrationRsvp, models.RegistrationRsvp.registration_id == models.Registration.id,
+        )
+
+        if self._db.bind.dialect.name == "postgresql":
+            # Both predicates are served by the GIN trigram indexes: `%>` is word similarity above
+            # pg_trgm.word_similarity_threshold, ILIKE catches exact fragments too short to be similar
+            pattern = "%" + re.sub(r"([/%_])", r"/\1", query) + "%"
+            score = func.greatest(*(func.word_similarity(query, func.coalesce(column, "")) for column in columns))
+            stmt = stmt.where(or_(*(
+                or_(column.op("%>")(query), column.ilike(pattern, escape="/")) for column in columns
+            ))).order_by(score.desc(), func.length(models.Registration.full_name)).limit(limit)
+            result = await self._read_db.execute(stmt)
+            return [SearchResult._make(row) for row in result]
+
+        if self._search_index is None:
+            # Without the in-memory index only a plain substring scan is left
+            stmt = stmt.where(or_(*(column.contains(query, autoescape=True) for column in columns))).limit(limit)
+            result = await self._read_db.execute(stmt)
+            return [SearchResult._make(row) for row in result]
+
+        ids = self._search_index.search(query, limit)
+        if not ids:
+            return []
+        result = await self._read_db.execute(stmt.where(models.Registration.id.in_(ids)))
+        rows = {row[0]: SearchResult._make(row) for row in result}
+        return [rows[registration_id] for registration_id in ids if registration_id in rows]
+
+    # Duplicate detection
+    async def _replace_identities(self, chat_id: int, registration_id: int, keys: list[str]) -> None:
+        # The chat's identity keys follow its latest registration: stale keys (say, a corrected passport) go away
+        table = models.RegistrationIdentity
+        await self._db.execute(
+            delete(table).where(table.user_chat_id == chat_id, table.identity_key.not_in(keys))
+        )
+        if not keys:
+            return
+        stmt = self._insert(table).values([
+            {"identity_key": key, "user_chat_id": chat_id, "registration_id": registration_id} for key in keys
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.identity_key, table.user_chat_id],
+            set_={"registration_id": stmt.excluded.registration_id, "updated_on": datetime.now()},
+        )
+        await self._db.execute(stmt)
+
+    async def find_duplicate(
+        self,
+        chat_id: int,
+        *,
+        full_name: str,
+        passport_series: str | None,
+        passport_number: str | None,
+        study_group: str | None,
+    ) -> int | None:
+        """Id of a registration of the same person made from another chat, if any."""
+        keys = identity_keys(
+            full_name=full_name, passport_series=passport_series, passport_number=passport_number, study_group=study_group,
+        )
+        if not keys:
+            return None
+        table = models.RegistrationIdentity
+        stmt = select(table.registration_id).where(
+            table.identity_key.in_(keys), table.user_chat_id != chat_id,
+        ).limit(1)
+        result = await self._db.execute(stmt)
+        return result.scalar_one_or_none()
+
+    async def backfill_identities(self, batch_size: int = 1000) -> int:
+        # Fills the identity table for registrations made before duplicate detection; a no-op once it has rows
+        table = models.RegistrationIdentity
+        if (await self._db.execute(select(table.identity_key).limit(1))).first() is not None:
+            return 0
+        count = 0
+        last_id = 0
+        while True:
+            # Keyset pages in id order: a chat's later registration overrides the keys of an earlier one
+            stmt = select(
+                models.Registration.id,
+                models.Registration.user_chat_id,
+                models.Registration.full_name,
+                models.Registration.passport_series,
+                models.Registration.passport_number,
+                models.Registration.study_group,
+            ).where(models.Registration.id > last_id).order_by(models.Registration.id).limit(batch_size)
+            rows = (await self._db.execute(stmt)).all()
+            if not rows:
+                return count
+            identities = {}
+            for registration_id, chat_id, full_name, series, number, group in rows:
+                keys = identity_keys(full_name=full_name, passport_series=series, passport_number=number, study_group=group)
+                for key in keys:
+                    identities[key, chat_id] = registration_id
+            last_id = rows[-1][0]
+            count += len(rows)
+            if not identities:
+                continue
+            stmt = self._insert(table).values([
+                {"identity_key": key, "user_chat_id": chat_id, "registration_id": registration_id}
+                for (key, chat_id), registration_id in identities.items()
+            ])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.identity_key, table.user_chat_id],
+                set_={"registration_id": stmt.excluded.registration_id},
+            )
+            await self._write(stmt)
+
+    async def list_duplicates(self) -> list[DuplicateGroup]:
+        # One grouped query over the identity index: keys held by more than one chat
+        table = models.RegistrationIdentity
+        member = models.Registration.id.cast(Text) + " " + models.Registration.full_name
+        stmt = select(
+            table.identity_key,
+            func.count(),
+            func.aggregate_strings(member, "\n"),
+        ).join(
+            models.Registration, models.Registration.id == table.registration_id,
+        ).group_by(table.identity_key).having(func.count() > 1).order_by(func.count().desc())
+        result = await self._read_db.execute(stmt)
+        return [
+            DuplicateGroup(kind=key.partition(":")[0], count=count, registrations=members.split("\n"))
+            for key, count, members in result
+        ]
 
     # RSVP methods
     async def get_rsvp(self, registration_id: int) -> models.RegistrationRsvp | None:
@@ -99,14 +368,7 @@ class Storage:
         return result.scalar_one_or_none()
 
     async def ensure_rsvp(self, registration_id: int) -> models.RegistrationRsvp:
-        rsvp = await self.get_rsvp(registration_id)
-        if rsvp:
-            return rsvp
-        rsvp = models.RegistrationRsvp(registration_id=registration_id, status="registered")
-        self._db.add(rsvp)
-        await self._db.commit()
-        await self._db.refresh(rsvp)
-        return rsvp
+        return await self.update_rsvp(registration_id)
 
     async def update_rsvp(
         self,
@@ -117,21 +379,48 @@ class Storage:
         confirmed_at = None,
         waitlist_position: int | None = None,
         reminder_count: int | None = None,
-    ) -> models.RegistrationRsvp:
-        rsvp = await self.ensure_rsvp(registration_id)
-        if status is not None:
-            rsvp.status = status
-        if confirmation_deadline is not None:
-            rsvp.confirmation_deadline = confirmation_deadline
-        if confirmed_at is not None:
-            rsvp.confirmed_at = confirmed_at
-        if waitlist_position is not None:
-            rsvp.waitlist_position = waitlist_position
-        if reminder_count is not None:
-            rsvp.reminder_count = reminder_count
-        await self._db.commit()
+        unless_status: tuple[str, ...] = (),
+    ) -> models.RegistrationRsvp | None:
+        # Single INSERT ... ON CONFLICT ... RETURNING: only the given fields change on an existing row,
+        # a row with one of `unless_status` statuses is left untouched and None is returned
+        changes = {
+            key: value
+            for key, value in (
+                ("status", status),
+                ("confirmation_deadline", confirmation_deadline),
+                ("confirmed_at", confirmed_at),
+                ("waitlist_position", waitlist_position),
+                ("reminder_count", reminder_count),
+            )
+            if value is not None
+        }
+        stmt = self._insert(models.RegistrationRsvp).values(
+            registration_id=registration_id,
+            **{"status": "registered", **changes},
+        )
+        table = models.RegistrationRsvp.__table__
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.registration_id],
+            # A no-op update when nothing changes, so that RETURNING yields the existing row
+            set_={**changes, "updated_on": datetime.now()} if changes else {"registration_id": stmt.excluded.registration_id},
+            where=table.c.status.not_in(unless_status) if unless_status else None,
+        )
+        stmt = stmt.returning(models.RegistrationRsvp, self._rsvp_chat_id())
+        row = (await self._write(stmt, execution_options={"populate_existing": True})).one_or_none()
+        if row is None:
+            return None
+        rsvp, chat_id = row
+        if self._rsvp_index is not None:
+            self._rsvp_index.set_status(registration_id, rsvp.status, chat_id)
         return rsvp
 
+    @staticmethod
+    def _rsvp_chat_id():
+        # RETURNING cannot correlate a subquery on its own, so the outer column is referenced by name
+        return select(models.Registration.user_chat_id).where(
+            models.Registration.id == literal_column(f"{models.RegistrationRsvp.__tablename__}.registration_id")
+        ).scalar_subquery()
+
     async def count_confirmed(self) -> int:
         stmt = select(func.count(models.RegistrationRsvp.id)).filter_by(status="confirmed")
         result = await self._db.execute(stmt)
@@ -150,25 +439,93 @@ class Storage:
         result = await self._db.execute(stmt)
         return result.scalar_one_or_none()
 
+    # Export watermarks
+    async def get_export_watermark(self, target: str) -> datetime | None:
+        stmt = select(models.ExportWatermark.exported_at).filter_by(target=target)
+        result = await self._db.execute(stmt)
+        return result.scalar_one_or_none()
+
+    async def save_export_watermark(self, target: str, exported_at: datetime) -> None:
+        stmt = self._insert(models.ExportWatermark).values(target=target, exported_at=exported_at)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[models.ExportWatermark.target],
+            set_={"exported_at": stmt.excluded.exported_at, "updated_on": datetime.now()},
+        )
+        await self._write(stmt)
+
     # Consent
     async def has_consent(self, chat_id: int) -> bool:
-        stmt = select(models.UserConsent).filter_by(chat_id=chat_id)
+        stmt = select(models.UserConsent.chat_id).filter_by(chat_id=chat_id)
         result = await self._db.execute(stmt)
         return result.scalar_one_or_none() is not None
 
     async def save_consent(self, chat_id: int) -> None:
-        exists = await self.has_consent(chat_id)
-        if exists:
-            return
-        self._db.add(models.UserConsent(chat_id=chat_id))
-        await self._db.commit()
+        stmt = self._insert(models.UserConsent).values(chat_id=chat_id).on_conflict_do_nothing(
+            index_elements=[models.UserConsent.chat_id],
+        )
+        await self._write(stmt)
 
     # Broadcast helpers
     async def list_all_chat_ids(self) -> list[int]:
         # Collect chat ids from both consents and registrations
-        result_regs = await self._db.execute(select(models.Registration.user_chat_id))
-        result_cons = await self._db.execute(select(models.UserConsent.chat_id))
+        result_regs = await self._read_db.execute(select(models.Registration.user_chat_id))
+        result_cons = await self._read_db.execute(select(models.UserConsent.chat_id))
         chat_ids: set[int] = set()
         chat_ids.update([int(x) for x in result_regs.scalars().all()])
         chat_ids.update([int(x) for x in result_cons.scalars().all()])
         return list(chat_ids)
+
+    async def iter_broadcast_recipients(
+        self,
+        *,
+        status: str | None = None,
+        university: str | None = None,
+        exclude_university: str | None = None,
+        batch_size: int = 500,
+    ) -> AsyncIterator[list[BroadcastRecipient]]:
+        # Short keyset pages by chat rather than one cursor held open for the whole (rate-limited, minutes long)
+        # broadcast: a hot standby cancels long queries on replay conflicts, and the primary would keep a
+        # transaction open throughout. Filters apply to each chat's latest registration only
+        newer = aliased(models.Registration)
+        latest = ~exists(select(newer.id).where(
+            newer.user_chat_id == models.Registration.user_chat_id,
+            or_(
+                newer.created_on > models.Registration.created_on,
+                and_(newer.created_on == models.Registration.created_on, newer.id > models.Registration.id),
+            ),
+        ))
+        stmt = select(
+            models.Registration.user_chat_id,
+            models.Registration.full_name,
+            models.Registration.university,
+            models.Registration.study_group,
+            models.RegistrationRsvp.status,
+        ).outerjoin(
+            models.RegistrationRsvp, models.RegistrationRsvp.registration_id == models.Registration.id,
+        ).where(latest).order_by(models.Registration.user_chat_id).limit(batch_size)
+        if status == "registered":
+            # Registrations without an RSVP row are plain registered ones too
+            stmt = stmt.where(or_(models.RegistrationRsvp.status == status, models.RegistrationRsvp.status.is_(None)))
+        elif status is not None:
+            stmt = stmt.where(models.RegistrationRsvp.status == status)
+        if university is not None:
+            stmt = stmt.where(models.Registration.university == university)
+        if exclude_university is not None:
+            stmt = stmt.where(or_(
+                models.Registration.university.is_(None),
+                models.Registration.university != exclude_university,
+            ))
+
+        db = self._read_db
+        last_chat_id = None
+        while True:
+            page = stmt if last_chat_id is None else stmt.where(models.Registration.user_chat_id > last_chat_id)
+            rows = (await db.execute(page)).all()
+            # Ends the read transaction: nothing is held between pages while the batch is being sent
+            await db.commit()
+            if not rows:
+                return
+            last_chat_id = rows[-1][0]
+            yield [BroadcastRecipient._make(row) for row in rows]
+            if len(rows) < batch_size:
+                return